@@ -5,9 +5,11 @@ from discord import app_commands
 
 from datetime import datetime, timezone, timedelta
 from datetime import date as DateType
+from datetime import time as TimeType
 
 from dotenv import load_dotenv
 import os
+import json
 import asyncio
 import tempfile
 import pandas as pd
@@ -26,6 +28,7 @@ import time, random
 # --- Twitter --- #
 import uuid, subprocess
 import traceback
+import hashlib
 
 # -- YouTube Upload --- #
 from googleapiclient.http import MediaFileUpload
@@ -34,24 +37,83 @@ from googleapiclient.http import MediaFileUpload
 from typing import Optional
 import re
 
+load_dotenv()  # Load environment variables from .env file
+
+# --- Guild Config ---
+# JSON file describing every community the bot runs scheduled scrapes for
+CONFIG_PATH = os.getenv("SCRAPER_CONFIG", "guilds.json")
+
+def load_config(path: str):
+    """Loads the multi-guild scheduler config from a JSON file."""
+    if not os.path.exists(path):
+        raise ValueError(f"Scheduler config '{path}' not found. Set SCRAPER_CONFIG or create guilds.json.")
+    with open(path, "r", encoding="utf-8") as config_file:
+        config = json.load(config_file)
+
+    guilds = []
+    seen_guild_ids = set()
+    for index, entry in enumerate(config.get("guilds", [])):
+        guild_name = entry.get("name", entry.get("guild_id", f"#{index + 1}"))
+        for field in ("guild_id", "log_channel_id", "sheet_name"):
+            if field not in entry:
+                raise ValueError(f"Guild '{guild_name}' in scheduler config '{path}' is missing '{field}'.")
+
+        guild_id = int(entry["guild_id"])
+        if guild_id in seen_guild_ids:
+            raise ValueError(f"Duplicate guild_id {guild_id} in scheduler config '{path}'.")
+        seen_guild_ids.add(guild_id)
+
+        run_time = entry.get("run_time", "00:05")
+        try:
+            parsed_run_time = datetime.strptime(run_time, "%H:%M")
+        except (TypeError, ValueError):
+            raise ValueError(f"Guild '{guild_name}' in scheduler config '{path}' has invalid run_time '{run_time}'. Use HH:MM (JST).")
+
+        guilds.append({
+            "name": str(guild_name),
+            "guild_id": guild_id,
+            "channel_ids": [int(cid) for cid in entry.get("channel_ids", [])],
+            "log_channel_id": int(entry["log_channel_id"]),
+            "sheet_name": entry["sheet_name"],
+            "scrape_hour": parsed_run_time.hour,
+            "scrape_minute": parsed_run_time.minute,
+        })
+
+    return {
+        "guilds": guilds,
+        "stagger_minutes": int(config.get("stagger_minutes", 30)),
+        "sharded": bool(config.get("sharded", False)),
+        "shard_count": config.get("shard_count"),
+    }
+
+CONFIG = load_config(CONFIG_PATH)
+GUILD_CONFIGS = CONFIG["guilds"]
+
+def get_guild_config(guild_id: int):
+    """Returns the config entry for a guild, or None if it is not configured."""
+    return next((g for g in GUILD_CONFIGS if g["guild_id"] == guild_id), None)
+
 intents = discord.Intents.default()
 intents.message_content = True
 
-GUILD_ID = discord.Object(id=843153441621803028)
+# Switch to an auto-sharded client once the bot serves enough guilds to need it
+BotBase = commands.AutoShardedBot if CONFIG["sharded"] else commands.Bot
 
-class MyBot(commands.Bot):
+class MyBot(BotBase):
     def __init__(self):
-        super().__init__(command_prefix="!", intents=intents)
+        shard_options = {}
+        if CONFIG["sharded"] and CONFIG["shard_count"]:
+            shard_options["shard_count"] = int(CONFIG["shard_count"])
+        super().__init__(command_prefix="!", intents=intents, **shard_options)
 
     async def setup_hook(self):
         await self.tree.sync()
-        bot.tree.clear_commands(guild=GUILD_ID)
-        await bot.tree.sync(guild=GUILD_ID)
 
-    
+
     async def on_ready(self):
-        if not scheduled_scrape.is_running():
-            scheduled_scrape.start()
+        for scheduled_scrape in SCHEDULED_SCRAPES:
+            if not scheduled_scrape.is_running():
+                scheduled_scrape.start()
         print(f"Logged in as {self.user} (ID: {self.user.id})")
         print('------')
         
@@ -77,51 +139,102 @@ bot = MyBot()
 # -- Scheduled Task Helper ---
 JST = timezone(timedelta(hours=9))
 
-TARGET_CHANNELS = []
-
-SCHEDULED_SERVER_ID = 843153441621803028 # hachi-hive
-
-TARGET_CHANNEL_IDS = [
-    866072626241994772, # music
-    867403789934002216 # vtubers-music
-]
-
-LOG_CHANNEl_ID = 925698743225942018 # bot-spam
+# Only one scheduled scrape runs at a time so guilds never compete for quota/bandwidth
+SCHEDULED_SCRAPE_LOCK = asyncio.Lock()
+
+def staggered_run_times(guild_configs, stagger_minutes: int):
+    """Assigns each guild a JST run time, pushing later guilds back so their windows don't overlap."""
+    day_minutes = 24 * 60
+    ordered = sorted(guild_configs, key=lambda g: (g["scrape_hour"], g["scrape_minute"]))
+    requested = [g["scrape_hour"] * 60 + g["scrape_minute"] for g in ordered]
+
+    # Start the day after the largest gap between requested times, so runs around midnight stay together
+    if ordered:
+        start = max(range(len(ordered)), key=lambda i: (requested[i] - requested[i - 1]) % day_minutes)
+        ordered = ordered[start:] + ordered[:start]
+        requested = requested[start:] + requested[:start]
+
+    slots = []
+    previous_slot = None
+    unstaggered = []
+    for guild_config, slot in zip(ordered, requested):
+        if slots and slot < slots[0][1]:
+            slot += day_minutes
+        if previous_slot is not None and slot < previous_slot + stagger_minutes:
+            pushed_slot = previous_slot + stagger_minutes
+            # The last run of the day must also leave room before the first run of the next day
+            if pushed_slot + stagger_minutes > slots[0][1] + day_minutes:
+                # Day is full: keep the requested time and let SCHEDULED_SCRAPE_LOCK queue this run
+                unstaggered.append(guild_config["name"])
+                slots.append((guild_config["guild_id"], slot))
+                continue
+            slot = pushed_slot
+        slots.append((guild_config["guild_id"], slot))
+        previous_slot = slot
+
+    if unstaggered:
+        print(f"WARNING: Cannot fit {len(slots)} scheduled scrapes {stagger_minutes} minutes apart into 24 hours. "
+              f"{len(unstaggered)} guild(s) keep their requested time and will wait for earlier runs: {', '.join(unstaggered)}")
+
+    run_times = {}
+    for guild_id, slot in slots:
+        wrapped = slot % day_minutes
+        run_times[guild_id] = TimeType(hour=wrapped // 60, minute=wrapped % 60, tzinfo=JST)
+    return run_times
+
+
+async def run_scheduled_scrape(guild_config):
+    """Scrapes every configured channel of one guild and reports to its log channel."""
+    print(f"Scheduled scrape for {guild_config['name']} triggered at {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S %Z')}")
+    guild = bot.get_guild(guild_config["guild_id"])
+    if not guild:
+        print(f"Guild {guild_config['guild_id']} not found. Skipping scheduled scrape.")
+        return
+
+    log_channel = guild.get_channel(guild_config["log_channel_id"])
+    if not log_channel:
+        print(f"Log channel {guild_config['log_channel_id']} not found in guild {guild.name}. Results will only be printed.")
+
+    for channel_id in guild_config["channel_ids"]:
+        # Look up within the guild so channel IDs from another server are caught here
+        channel = guild.get_channel_or_thread(channel_id)
+        if not channel:
+            print(f"Channel {channel_id} not found in guild {guild.name}.")
+            continue
+        print(f"Starting scheduled scrape for channel: {channel.name}")
 
-# Daily schedule → 12:00 AM JST
-SCRAPE_HOUR = 0
-SCRAPE_MINUTE = 5
+        try:
+            followup_message = await run_scrape(None, channel.name, is_scheduled=True, guild=guild)
+            print(f"Scheduled scrape result for {channel.name}: {followup_message}")
+            if log_channel:
+                await log_channel.send(followup_message)
+        except Exception as e:
+            print(f"An error occurred during scheduled scrape for channel {channel.name}: {e}")
+            traceback.print_exc()
+            if log_channel:
+                await log_channel.send(f"An error occurred during scheduled scrape for channel {channel.name}: {e}")
 
-def seconds_until_target(hour: int, minute: int):
-    """Returns seconds until the next scheduled JST time."""
-    now = datetime.now(JST)
-    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-    if target <= now:
-        target += timedelta(days=1)
-    return (target - now).total_seconds()
 
+def make_scheduled_scrape(guild_config, run_time: TimeType):
+    """Builds a daily task that fires at the guild's run time instead of sleeping inside a 24h loop."""
+    @tasks.loop(time=run_time)
+    async def scheduled_scrape():
+        async with SCHEDULED_SCRAPE_LOCK:
+            await run_scheduled_scrape(guild_config)
+    return scheduled_scrape
 
-@tasks.loop(hours=24)
-async def scheduled_scrape():
-    print(f"Scheduled scrape task triggered at {datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S %Z')}")
-    wait_seconds = seconds_until_target(SCRAPE_HOUR, SCRAPE_MINUTE)
-    print(f"Waiting {wait_seconds} seconds until next scheduled scrape time ({SCRAPE_HOUR:02}:{SCRAPE_MINUTE:02} JST)")
-    await asyncio.sleep(wait_seconds)
-    
-    HACHI_HIVE = bot.get_guild(SCHEDULED_SERVER_ID)
 
-    for channel_id in TARGET_CHANNEL_IDS:
-        channel = bot.get_channel(channel_id).name
-        print(f"Starting scheduled scrape for channel: {channel}")
-        if not channel:
-            print(f"Channel {channel} not found in guild.")
-            continue
+def build_scheduled_scrapes():
+    """Creates one staggered daily task per configured guild."""
+    run_times = staggered_run_times(GUILD_CONFIGS, CONFIG["stagger_minutes"])
+    scheduled_scrapes = []
+    for guild_config in GUILD_CONFIGS:
+        run_time = run_times[guild_config["guild_id"]]
+        print(f"Scheduled scrape for {guild_config['name']} at {run_time.hour:02}:{run_time.minute:02} JST")
+        scheduled_scrapes.append(make_scheduled_scrape(guild_config, run_time))
+    return scheduled_scrapes
 
-        try:
-            followup_message = await run_scrape(None, channel, is_scheduled=True)
-            await bot.get_channel(LOG_CHANNEl_ID).send(followup_message)
-        except Exception as e:
-            await bot.get_channel(LOG_CHANNEl_ID).send(f"An error occurred during scheduled scrape for channel {channel.name}: {e}")
+SCHEDULED_SCRAPES = build_scheduled_scrapes()
 
 
 
@@ -188,6 +301,82 @@ async def download_twitter_media(twitter_url, temp_dir):
         traceback.print_exc()
         return None
 
+# --- Media Dedup Helpers ---
+# Persistent index of sha256(media file) -> YouTube video ID, so identical media is only uploaded once
+MEDIA_INDEX_PATH = os.getenv("MEDIA_INDEX_PATH", "media_index.json")
+
+def hash_media_file(file_path, chunk_size=1024 * 1024):
+    """Returns the sha256 hex digest of a file, reading it in chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as media_file:
+        for chunk in iter(lambda: media_file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_media_index():
+    """Loads the hash -> YouTube video ID index, or an empty one if missing/corrupt."""
+    if not os.path.exists(MEDIA_INDEX_PATH):
+        return {}
+    try:
+        with open(MEDIA_INDEX_PATH, "r", encoding="utf-8") as index_file:
+            media_index = json.load(index_file)
+    except Exception as e:
+        print(f"Error reading media index {MEDIA_INDEX_PATH}: {e}. Starting with an empty index.")
+        return {}
+    if not isinstance(media_index, dict) or not all(isinstance(k, str) and isinstance(v, str) for k, v in media_index.items()):
+        print(f"Media index {MEDIA_INDEX_PATH} is not a hash -> video ID mapping. Starting with an empty index.")
+        return {}
+    return media_index
+
+def save_media_index():
+    """Writes the in-memory media index to disk. Errors are logged, the in-memory index stays authoritative."""
+    tmp_path = f"{MEDIA_INDEX_PATH}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as index_file:
+            json.dump(MEDIA_INDEX, index_file, indent=2)
+        # Atomic swap so a crash can't leave a half-written index
+        os.replace(tmp_path, MEDIA_INDEX_PATH)
+    except Exception as e:
+        print(f"Error writing media index {MEDIA_INDEX_PATH}: {e}. Keeping the in-memory index.")
+
+# Shared by every scrape (manual and scheduled) so an upload from one run is seen by all others
+MEDIA_INDEX = load_media_index()
+# Hashes whose upload is still in progress -> event set once that upload finishes
+PENDING_MEDIA_UPLOADS = {}
+
+async def upload_media_once(youtube_service, file_path, media_hash, title, description):
+    """Returns (video_id, reused) for this media, uploading it only if no run has done so already."""
+    # Another run is uploading the same file right now: wait for it instead of uploading twice
+    while media_hash in PENDING_MEDIA_UPLOADS:
+        await PENDING_MEDIA_UPLOADS[media_hash].wait()
+
+    existing_vid_id = MEDIA_INDEX.get(media_hash)
+    if existing_vid_id:
+        print(f"  Media already uploaded as {existing_vid_id} (sha256 {media_hash[:12]}). Skipping upload.")
+        return existing_vid_id, True
+
+    upload_done = asyncio.Event()
+    PENDING_MEDIA_UPLOADS[media_hash] = upload_done
+    try:
+        # Uploading costs 1600 units! Be careful.
+        new_vid_id = await upload_video_to_youtube(youtube_service, file_path, title, description)
+        if new_vid_id:
+            MEDIA_INDEX[media_hash] = new_vid_id
+            save_media_index()
+        return new_vid_id, False
+    finally:
+        del PENDING_MEDIA_UPLOADS[media_hash]
+        upload_done.set()
+
+def forget_media_upload(video_id):
+    """Drops every index entry pointing at a video that no longer exists, so the media is uploaded again."""
+    stale_hashes = [media_hash for media_hash, vid in MEDIA_INDEX.items() if vid == video_id]
+    for media_hash in stale_hashes:
+        del MEDIA_INDEX[media_hash]
+    if stale_hashes:
+        print(f"  Removed {len(stale_hashes)} media index entries pointing at missing video {video_id}.")
+        save_media_index()
+
 # --- YouTube Upload Helper ---
 async def upload_video_to_youtube(youtube_service, file_path, title, description, privacy_status="unlisted"):
     """Uploads a video file to YouTube."""
@@ -215,12 +404,13 @@ async def upload_video_to_youtube(youtube_service, file_path, title, description
         
         # Wrap the execution of the request object for the metadata part
         # The media_body upload has its own resumable logic.
+        # Run it in a thread so the upload doesn't block the Discord bot (or other scrapes)
         response = None
         backoff_time = 1.0
         max_retries = 3 # Retries for the initial insert request, not the media upload itself
         for attempt in range(max_retries + 1):
             try:
-                response = request_obj.execute()
+                response = await asyncio.to_thread(request_obj.execute)
                 break # Success
             except HttpError as e:
                 if attempt == max_retries or e.resp.status not in [429, 500, 502, 503, 504]: # Non-retryable or max retries
@@ -228,7 +418,7 @@ async def upload_video_to_youtube(youtube_service, file_path, title, description
                     raise e
                 wait_time = min(backoff_time + random.uniform(0, 1), 16.0)
                 print(f"Upload API call failed for '{title}' (Attempt {attempt+1}), retrying in {wait_time:.2f}s: {e}")
-                time.sleep(wait_time)
+                await asyncio.sleep(wait_time)
                 backoff_time *= 2
             except Exception as e:
                 print(f"An unexpected error during YouTube video insert execute for '{title}': {e}")
@@ -291,16 +481,20 @@ async def channel_autocomplete(interaction: discord.Interaction, current: str):
 
 
 # 🔹 SCRAPE FUNCTION
-async def run_scrape(interaction, channel_name: str, date: Optional[str] = None, is_scheduled=False):
+async def run_scrape(interaction, channel_name: str, date: Optional[str] = None, is_scheduled=False, guild=None):
     if not is_scheduled and interaction:
         operator = interaction.user
         guild = interaction.guild
         all_channels = guild.text_channels
     else:
         operator = "Scheduled Task"
-        guild = bot.get_guild(SCHEDULED_SERVER_ID)
         all_channels = guild.text_channels
 
+    guild_config = get_guild_config(guild.id)
+    sheet_name = guild_config["sheet_name"] if guild_config else None
+    if not sheet_name:
+        print(f"Guild '{guild.name}' (ID: {guild.id}) has no sheet_name configured. Skipping Google Sheets export.")
+
     threads = []
     for ch in all_channels:
         threads.extend(ch.threads)
@@ -444,7 +638,8 @@ async def run_scrape(interaction, channel_name: str, date: Optional[str] = None,
             print(f"Playlist created successfully. ID: {playlist_id}")
 
             video_ids_to_process = set()
-            invalid_links_details = [] 
+            invalid_links_details = []
+            reused_video_ids = set() # Video IDs taken from the media index rather than freshly uploaded
             print(f"--- Processing {len(links_to_process)} raw links... ---")
 
             for link_idx, link_info in enumerate(links_to_process):
@@ -485,12 +680,15 @@ async def run_scrape(interaction, channel_name: str, date: Optional[str] = None,
                         
                         fpath = await download_twitter_media(link, temp_download_dir)
                         if fpath:
+                            # Quote-tweets/reposts often carry the exact same file: reuse the earlier upload
+                            media_hash = await asyncio.to_thread(hash_media_file, fpath)
                             yt_title = f"Twitter Media from {link_info['message_author']} ({title_date})"
-                            # Uploading costs 1600 units! Be careful.
-                            new_vid_id = await upload_video_to_youtube(youtube, fpath, yt_title, f"Source: {link}")
-                            if new_vid_id:
-                                video_ids_to_process.add(new_vid_id)
-                            if os.path.exists(fpath): 
+                            vid_id, reused = await upload_media_once(youtube, fpath, media_hash, yt_title, f"Source: {link}")
+                            if vid_id:
+                                video_ids_to_process.add(vid_id)
+                                if reused:
+                                    reused_video_ids.add(vid_id)
+                            if os.path.exists(fpath):
                                 os.remove(fpath)
                     except Exception as e:
                         print(f"  Error handling Twitter link {link}: {e}")
@@ -532,6 +730,11 @@ async def run_scrape(interaction, channel_name: str, date: Optional[str] = None,
                         
                     except Exception as e:
                         print(f" ❌ Failed: {e}")
+                        # A reused upload that was deleted/rejected must be uploaded again next time
+                        if vid_id in reused_video_ids and isinstance(e, HttpError):
+                            err_content = e.content.decode('utf-8') if e.content else str(e)
+                            if e.resp.status == 404 or "videoNotFound" in err_content:
+                                forget_media_upload(vid_id)
                         # Even if it fails, we sleep slightly to let API cool down
                         await asyncio.sleep(1)
                     
@@ -539,13 +742,13 @@ async def run_scrape(interaction, channel_name: str, date: Optional[str] = None,
             # 📊 GOOGLE SHEETS EXPORT PHASE
             # ==============================================================================
             
-            if final_video_list:
+            if final_video_list and sheet_name:
                 print(f"Fetching details for {len(final_video_list)} videos for Sheets...")
                 
                 # 1. Setup Google Sheets Client
                 try:
                     gc = gspread.service_account(filename='service_account.json')
-                    sh = gc.open("HACHI HIVE Playlists") 
+                    sh = gc.open(sheet_name)
                     worksheet = sh.sheet1
                 except Exception as e:
                     print(f"⚠️ Sheets Auth Error: {e}. Make sure service_account.json exists and Drive API is enabled.")
@@ -685,7 +888,6 @@ async def interaction_scrape(
 
     
 # Get DISCORD_TOKEN from environment variable for security
-load_dotenv()  # Load environment variables from .env file
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 if not DISCORD_TOKEN:
     raise ValueError("DISCORD_BOT_TOKEN environment variable not set.")